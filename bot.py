@@ -5,8 +5,11 @@ A Telegram bot for handling insurance-related queries and services.
 """
 
 import os
+import re
+import sys
+import asyncio
 import logging
-from dotenv import load_dotenv
+from weakref import WeakValueDictionary
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -14,12 +17,13 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    PicklePersistence,
     filters,
     ContextTypes
 )
 
-# Load environment variables
-load_dotenv()
+from config import Config
+from utils import BASE_RATES, InsuranceType, start_log_drainer
 
 # Configure logging
 logging.basicConfig(
@@ -31,42 +35,206 @@ logger = logging.getLogger(__name__)
 # Conversation states
 MAIN_MENU, INSURANCE_TYPE, PERSONAL_INFO, QUOTE_DETAILS = range(4)
 
+# Intent keywords as frozensets: the message is tokenized once and each
+# intent test is a C-level set intersection
+_WORD_RE = re.compile(r'[a-z]+')
+_QUOTE_KEYWORDS = frozenset({'quote', 'price', 'cost', 'rate'})
+_CLAIM_KEYWORDS = frozenset({'claim', 'accident', 'damage'})
+_HELP_KEYWORDS = frozenset({'help', 'support', 'question'})
+
+_MENU_PROMPT = "🎯 What type of insurance are you interested in?"
+
+# Display labels for insurance type selections, built once at import
+_INSURANCE_TYPE_LABELS = {
+    "auto": "🚗 Auto Insurance",
+    "home": "🏠 Home Insurance",
+    "health": "❤️ Health Insurance",
+    "travel": "✈️ Travel Insurance",
+    "business": "💼 Business Insurance"
+}
+
+# Static insurance information, allocated once at import
+_INSURANCE_INFO = {
+    "auto": """
+🚗 Auto Insurance Information
+
+Coverage Types:
+• Liability Coverage - Required by law
+• Collision Coverage - Covers vehicle damage
+• Comprehensive - Theft, vandalism, weather
+• Personal Injury Protection - Medical expenses
+• Uninsured Motorist - Protection from uninsured drivers
+
+Factors Affecting Rates:
+• Driving record
+• Vehicle type and age
+• Location
+• Coverage limits
+• Deductible amount
+            """,
+    "home": """
+🏠 Home Insurance Information
+
+Coverage Types:
+• Dwelling Coverage - Structure of your home
+• Personal Property - Your belongings
+• Liability Protection - Injury/damage claims
+• Additional Living Expenses - Temporary housing
+• Medical Payments - Guest injuries
+
+What's Typically Covered:
+• Fire and smoke damage
+• Weather-related damage
+• Theft and vandalism
+• Water damage (sudden)
+            """,
+    "health": """
+❤️ Health Insurance Information
+
+Plan Types:
+• HMO - Health Maintenance Organization
+• PPO - Preferred Provider Organization
+• EPO - Exclusive Provider Organization
+• POS - Point of Service
+
+Key Features:
+• Preventive care coverage
+• Prescription drug coverage
+• Emergency services
+• Mental health services
+• Maternity coverage
+            """,
+    "travel": """
+✈️ Travel Insurance Information
+
+Coverage Types:
+• Trip Cancellation/Interruption
+• Medical Emergency Coverage
+• Baggage Loss/Delay
+• Travel Delay Coverage
+• Emergency Evacuation
+
+When to Buy:
+• Within 14 days of initial trip payment
+• Before departure
+• Consider annual plans for frequent travelers
+            """,
+    "business": """
+💼 Business Insurance Information
+
+Essential Coverage:
+• General Liability - Customer injury/property damage
+• Professional Liability - Errors and omissions
+• Property Insurance - Business property protection
+• Workers' Compensation - Employee injury coverage
+• Cyber Liability - Data breach protection
+
+Industry-Specific Options:
+• Product liability
+• Commercial auto
+• Business interruption
+            """
+}
+
+async def _start_background_tasks(application: Application):
+    """Start background tasks once the application's event loop is running"""
+    start_log_drainer()
+
 class InsuranceBot:
     def __init__(self):
-        self.token = os.getenv('TELEGRAM_BOT_TOKEN')
+        self.token = Config.TELEGRAM_BOT_TOKEN
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
         
-        # Initialize application
-        self.application = Application.builder().token(self.token).build()
+        # Initialize application; process updates concurrently so slow handlers
+        # don't block unrelated chats
+        # Persist user_data and conversation state so restarts don't drop
+        # in-flight quote flows
+        persistence = PicklePersistence(filepath='bot_state.pkl')
+        self.application = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(True)
+            .persistence(persistence)
+            .post_init(_start_background_tasks)
+            .build()
+        )
+
+        # Per-chat locks keep update ordering within a chat; entries are
+        # garbage-collected once no handler holds the lock
+        self._chat_locks = WeakValueDictionary()
+
+        # Static keyboards, built once and reused across handlers
+        self._MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🚗 Auto Insurance", callback_data="auto")],
+            [InlineKeyboardButton("🏠 Home Insurance", callback_data="home")],
+            [InlineKeyboardButton("❤️ Health Insurance", callback_data="health")],
+            [InlineKeyboardButton("✈️ Travel Insurance", callback_data="travel")],
+            [InlineKeyboardButton("💼 Business Insurance", callback_data="business")],
+            [InlineKeyboardButton("❓ General Questions", callback_data="questions")]
+        ])
+        self._TYPE_ACTIONS_MARKUP = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📋 Get Quote", callback_data="get_quote")],
+            [InlineKeyboardButton("ℹ️ Learn More", callback_data="learn_more")],
+            [InlineKeyboardButton("📞 Talk to Agent", callback_data="talk_agent")],
+            [InlineKeyboardButton("⬅️ Back to Menu", callback_data="back_menu")]
+        ])
+        self._BACK_MARKUP = InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Back", callback_data="back_type")]
+        ])
+
+        # Dispatch table for the personal-info collection steps
+        self._STEP_HANDLERS = {
+            'name': self._handle_name,
+            'age': self._handle_age,
+            'location': self._handle_location
+        }
+
         self.setup_handlers()
-    
+
+    def _per_chat(self, handler):
+        """Wrap a handler so updates from the same chat are processed in order"""
+        async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            chat = update.effective_chat
+            if chat is None:
+                return await handler(update, context)
+            lock = self._chat_locks.get(chat.id)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._chat_locks[chat.id] = lock
+            async with lock:
+                return await handler(update, context)
+        return wrapped
+
     def setup_handlers(self):
         """Set up command and message handlers"""
-        
+        per_chat = self._per_chat
+
         # Command handlers
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        
+        self.application.add_handler(CommandHandler("help", per_chat(self.help_command)))
+
         # Conversation handler for insurance process
         conv_handler = ConversationHandler(
             entry_points=[
-                CommandHandler("start", self.start_command),
-                CommandHandler("quote", self.get_quote),
-                CommandHandler("menu", self.main_menu)
+                CommandHandler("start", per_chat(self.start_command)),
+                CommandHandler("quote", per_chat(self.get_quote)),
+                CommandHandler("menu", per_chat(self.main_menu))
             ],
             states={
-                MAIN_MENU: [CallbackQueryHandler(self.main_menu_handler)],
-                INSURANCE_TYPE: [CallbackQueryHandler(self.insurance_type_handler)],
-                PERSONAL_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.personal_info_handler)],
-                QUOTE_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.quote_details_handler)]
+                MAIN_MENU: [CallbackQueryHandler(per_chat(self.main_menu_handler))],
+                INSURANCE_TYPE: [CallbackQueryHandler(per_chat(self.insurance_type_handler))],
+                PERSONAL_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, per_chat(self.personal_info_handler))],
+                QUOTE_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, per_chat(self.quote_details_handler))]
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)]
+            fallbacks=[CommandHandler("cancel", per_chat(self.cancel))],
+            name="insurance_conversation",
+            persistent=True
         )
-        
+
         self.application.add_handler(conv_handler)
-        
+
         # Default message handler
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, per_chat(self.handle_message)))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -81,8 +249,13 @@ I'm here to help you with:
 
 Use the buttons below to get started!
         """
-        await update.message.reply_text(welcome_message)
-        return await self.main_menu(update, context)
+        # Send the welcome text and the menu keyboard as one message to halve
+        # the Telegram round trips per /start
+        await update.message.reply_text(
+            welcome_message.strip() + "\n\n" + _MENU_PROMPT,
+            reply_markup=self._MAIN_MENU_MARKUP
+        )
+        return MAIN_MENU
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
@@ -104,52 +277,26 @@ Use the buttons below to get started!
     
     async def main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show main menu with options"""
-        keyboard = [
-            [InlineKeyboardButton("🚗 Auto Insurance", callback_data="auto")],
-            [InlineKeyboardButton("🏠 Home Insurance", callback_data="home")],
-            [InlineKeyboardButton("❤️ Health Insurance", callback_data="health")],
-            [InlineKeyboardButton("✈️ Travel Insurance", callback_data="travel")],
-            [InlineKeyboardButton("💼 Business Insurance", callback_data="business")],
-            [InlineKeyboardButton("❓ General Questions", callback_data="questions")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message_text = "🎯 What type of insurance are you interested in?"
-        
+        reply_markup = self._MAIN_MENU_MARKUP
+
         if update.callback_query:
-            await update.callback_query.edit_message_text(message_text, reply_markup=reply_markup)
+            await update.callback_query.edit_message_text(_MENU_PROMPT, reply_markup=reply_markup)
         else:
-            await update.message.reply_text(message_text, reply_markup=reply_markup)
-        
+            await update.message.reply_text(_MENU_PROMPT, reply_markup=reply_markup)
+
         return MAIN_MENU
     
     async def main_menu_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle main menu selections"""
         query = update.callback_query
         await query.answer()
-        
-        insurance_types = {
-            "auto": "🚗 Auto Insurance",
-            "home": "🏠 Home Insurance", 
-            "health": "❤️ Health Insurance",
-            "travel": "✈️ Travel Insurance",
-            "business": "💼 Business Insurance"
-        }
-        
-        if query.data in insurance_types:
+
+        if query.data in _INSURANCE_TYPE_LABELS:
             context.user_data['insurance_type'] = query.data
-            
-            keyboard = [
-                [InlineKeyboardButton("📋 Get Quote", callback_data="get_quote")],
-                [InlineKeyboardButton("ℹ️ Learn More", callback_data="learn_more")],
-                [InlineKeyboardButton("📞 Talk to Agent", callback_data="talk_agent")],
-                [InlineKeyboardButton("⬅️ Back to Menu", callback_data="back_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
+
             await query.edit_message_text(
-                f"You selected: {insurance_types[query.data]}\n\nWhat would you like to do?",
-                reply_markup=reply_markup
+                f"You selected: {_INSURANCE_TYPE_LABELS[query.data]}\n\nWhat would you like to do?",
+                reply_markup=self._TYPE_ACTIONS_MARKUP
             )
             return INSURANCE_TYPE
         
@@ -181,11 +328,8 @@ Use the buttons below to get started!
         elif query.data == "learn_more":
             insurance_type = context.user_data.get('insurance_type', 'insurance')
             info_text = self.get_insurance_info(insurance_type)
-            
-            keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_type")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(info_text, reply_markup=reply_markup)
+
+            await query.edit_message_text(info_text, reply_markup=self._BACK_MARKUP)
         
         elif query.data == "talk_agent":
             await query.edit_message_text(
@@ -207,137 +351,65 @@ Use the buttons below to get started!
     
     def get_insurance_info(self, insurance_type):
         """Get information about specific insurance types"""
-        info = {
-            "auto": """
-🚗 Auto Insurance Information
-
-Coverage Types:
-• Liability Coverage - Required by law
-• Collision Coverage - Covers vehicle damage
-• Comprehensive - Theft, vandalism, weather
-• Personal Injury Protection - Medical expenses
-• Uninsured Motorist - Protection from uninsured drivers
-
-Factors Affecting Rates:
-• Driving record
-• Vehicle type and age
-• Location
-• Coverage limits
-• Deductible amount
-            """,
-            "home": """
-🏠 Home Insurance Information
-
-Coverage Types:
-• Dwelling Coverage - Structure of your home
-• Personal Property - Your belongings
-• Liability Protection - Injury/damage claims
-• Additional Living Expenses - Temporary housing
-• Medical Payments - Guest injuries
-
-What's Typically Covered:
-• Fire and smoke damage
-• Weather-related damage
-• Theft and vandalism
-• Water damage (sudden)
-            """,
-            "health": """
-❤️ Health Insurance Information
-
-Plan Types:
-• HMO - Health Maintenance Organization
-• PPO - Preferred Provider Organization
-• EPO - Exclusive Provider Organization
-• POS - Point of Service
-
-Key Features:
-• Preventive care coverage
-• Prescription drug coverage
-• Emergency services
-• Mental health services
-• Maternity coverage
-            """,
-            "travel": """
-✈️ Travel Insurance Information
-
-Coverage Types:
-• Trip Cancellation/Interruption
-• Medical Emergency Coverage
-• Baggage Loss/Delay
-• Travel Delay Coverage
-• Emergency Evacuation
-
-When to Buy:
-• Within 14 days of initial trip payment
-• Before departure
-• Consider annual plans for frequent travelers
-            """,
-            "business": """
-💼 Business Insurance Information
-
-Essential Coverage:
-• General Liability - Customer injury/property damage
-• Professional Liability - Errors and omissions
-• Property Insurance - Business property protection
-• Workers' Compensation - Employee injury coverage
-• Cyber Liability - Data breach protection
-
-Industry-Specific Options:
-• Product liability
-• Commercial auto
-• Business interruption
-            """
-        }
-        return info.get(insurance_type, "Information not available for this insurance type.")
+        return _INSURANCE_INFO.get(insurance_type, "Information not available for this insurance type.")
     
     async def personal_info_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle personal information collection"""
-        step = context.user_data.get('step')
-        user_input = update.message.text
-        
-        if step == 'name':
-            context.user_data['name'] = user_input
-            context.user_data['step'] = 'age'
+        handler = self._STEP_HANDLERS.get(context.user_data.get('step'))
+        if handler is None:
+            return PERSONAL_INFO
+        return await handler(update, context)
+
+    async def _handle_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Collect the customer's name and ask for their age"""
+        name = update.message.text
+        context.user_data['name'] = name
+        context.user_data['step'] = 'age'
+        await update.message.reply_text(
+            f"Thanks {name}! 👋\n\nNow, please enter your age:"
+        )
+        return PERSONAL_INFO
+
+    async def _handle_age(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Validate the customer's age and ask for their location"""
+        age_text = update.message.text.strip()
+        # isdecimal (not isdigit) matches exactly the characters int() accepts
+        if not age_text.isdecimal():
             await update.message.reply_text(
-                f"Thanks {user_input}! 👋\n\nNow, please enter your age:"
+                "Please enter a valid age (numbers only):"
             )
-        
-        elif step == 'age':
-            try:
-                age = int(user_input)
-                if 18 <= age <= 100:
-                    context.user_data['age'] = age
-                    context.user_data['step'] = 'location'
-                    await update.message.reply_text(
-                        "Great! Now please enter your location (City, State):"
-                    )
-                else:
-                    await update.message.reply_text(
-                        "Please enter a valid age between 18 and 100:"
-                    )
-            except ValueError:
-                await update.message.reply_text(
-                    "Please enter a valid age (numbers only):"
-                )
-        
-        elif step == 'location':
-            context.user_data['location'] = user_input
-            insurance_type = context.user_data.get('insurance_type', 'insurance')
-            
-            # Generate quote based on insurance type
-            quote = self.generate_quote(context.user_data, insurance_type)
-            
+            return PERSONAL_INFO
+
+        age = int(age_text)
+        if 18 <= age <= 100:
+            context.user_data['age'] = age
+            context.user_data['step'] = 'location'
             await update.message.reply_text(
-                f"🎉 Here's your {insurance_type} insurance quote:\n\n{quote}\n\n"
-                "💬 Would you like to:\n"
-                "• Adjust coverage options\n"
-                "• Talk to an agent\n"
-                "• Get quotes for other insurance types\n\n"
-                "Just let me know!"
+                "Great! Now please enter your location (City, State):"
+            )
+        else:
+            await update.message.reply_text(
+                "Please enter a valid age between 18 and 100:"
             )
-            return ConversationHandler.END
-        
         return PERSONAL_INFO
+
+    async def _handle_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Collect the customer's location and deliver the quote"""
+        context.user_data['location'] = update.message.text
+        insurance_type = context.user_data.get('insurance_type', 'insurance')
+
+        # Generate quote based on insurance type
+        quote = self.generate_quote(context.user_data, insurance_type)
+
+        await update.message.reply_text(
+            f"🎉 Here's your {insurance_type} insurance quote:\n\n{quote}\n\n"
+            "💬 Would you like to:\n"
+            "• Adjust coverage options\n"
+            "• Talk to an agent\n"
+            "• Get quotes for other insurance types\n\n"
+            "Just let me know!"
+        )
+        return ConversationHandler.END
     
     def generate_quote(self, user_data, insurance_type):
         """Generate a sample quote based on user data and insurance type"""
@@ -346,15 +418,8 @@ Industry-Specific Options:
         location = user_data.get('location', 'Unknown')
         
         # Sample quote calculation (in real app, this would use actual pricing algorithms)
-        base_rates = {
-            'auto': 800,
-            'home': 1200,
-            'health': 300,
-            'travel': 150,
-            'business': 2000
-        }
-        
-        base_rate = base_rates.get(insurance_type, 500)
+        insurance_enum = InsuranceType.from_str(insurance_type)
+        base_rate = BASE_RATES[insurance_enum] if insurance_enum is not None else 500
         
         # Age factor
         if age < 25:
@@ -398,16 +463,16 @@ Industry-Specific Options:
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular text messages"""
-        message_text = update.message.text.lower()
-        
+        tokens = set(_WORD_RE.findall(update.message.text.casefold()))
+
         # Simple keyword-based responses
-        if any(word in message_text for word in ['quote', 'price', 'cost', 'rate']):
+        if tokens & _QUOTE_KEYWORDS:
             await update.message.reply_text(
                 "💰 Looking for a quote? Use /quote or click the menu button below to get started!"
             )
             return await self.main_menu(update, context)
-        
-        elif any(word in message_text for word in ['claim', 'accident', 'damage']):
+
+        elif tokens & _CLAIM_KEYWORDS:
             await update.message.reply_text(
                 "🚨 Need to file a claim?\n\n"
                 "1. Call our 24/7 claims hotline: 1-800-CLAIMS\n"
@@ -415,8 +480,8 @@ Industry-Specific Options:
                 "3. Use our mobile app\n\n"
                 "Have your policy number ready!"
             )
-        
-        elif any(word in message_text for word in ['help', 'support', 'question']):
+
+        elif tokens & _HELP_KEYWORDS:
             return await self.help_command(update, context)
         
         else:
@@ -441,13 +506,42 @@ Industry-Specific Options:
     def run(self):
         """Start the bot"""
         logger.info("Starting Insurance Bot...")
-        
-        # Start polling for updates
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if webhook_url:
+            # Webhook mode: Telegram pushes updates immediately, removing
+            # long-poll round trips and allowing multiple workers behind a
+            # load balancer
+            self.application.run_webhook(
+                listen='0.0.0.0',
+                port=int(os.getenv('PORT', 8443)),
+                url_path=self.token,
+                webhook_url=f"{webhook_url}/{self.token}",
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            # Fall back to polling for local development; fetch the next batch
+            # immediately and keep the long poll open so bursts are picked up
+            # without dead time
+            self.application.run_polling(
+                allowed_updates=Update.ALL_TYPES,
+                poll_interval=0.0,
+                timeout=30,
+                drop_pending_updates=False
+            )
 
 def main():
     """Main function to run the bot"""
+    # Use uvloop's faster event loop when available (not supported on Windows)
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+
     try:
+        Config.validate()
         bot = InsuranceBot()
         bot.run()
     except ValueError as e: